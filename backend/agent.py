@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 
-import subprocess
-import json
 import re
 import os
-from datetime import datetime
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
 from functools import wraps
-from flask import Flask, jsonify, request, abort
+from itertools import repeat
+from urllib.parse import unquote
+import docker
+from docker.errors import DockerException
+import orjson
+from flask import Flask, Response, request, abort
 from flask_cors import CORS
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
@@ -26,9 +32,64 @@ PORT = 9797
 # The path to your Nginx configuration files.
 NGINX_SITES_ENABLED_PATH = '/etc/nginx/sites-enabled'
 
+# Solutions recognised by container name prefix (e.g. 'mailcow_redis' or
+# 'appwrite-worker') for containers without a Docker Compose project label.
+KNOWN_SOLUTIONS = ["mailcow", "appwrite"] # This list can be expanded
+
+# The UFW configuration file and the files UFW persists user rules in,
+# each paired with whether it holds IPv6 rules.
+UFW_CONF_PATH = '/etc/ufw/ufw.conf'
+UFW_RULES_PATHS = [
+    ('/etc/ufw/user.rules', False),
+    ('/etc/ufw/user6.rules', True),
+]
+
+# How long (in seconds) collected stats are served from cache before the
+# collectors are run again. Dashboards polling faster than this share a result.
+STATS_CACHE_TTL = 3
+
+# Up to how old (in seconds) cached stats may still be served while they are
+# refreshed in the background. Older stats are refreshed before responding.
+STATS_STALE_TTL = 2 * STATS_CACHE_TTL
+
+# The longest time (in seconds) a request waits for the data collectors
+# before responding with whatever has been collected so far.
+COLLECTOR_TIMEOUT = 10
+
+# How long (in seconds) to wait before reconnecting to the Docker events
+# stream after the daemon becomes unreachable.
+DOCKER_EVENTS_RETRY_DELAY = 5
+
 # --- IMPORTANT: Set your secret password here ---
 SECRET_PASSWORD = os.getenv('SECRET_PASSWORD', 'your-super-secret-password')
 
+# --- Parsing Patterns ---
+# Compiled once at import so the collectors don't pay for it on every request.
+
+# Nginx directives: server_name, proxy_pass, and ssl_certificate, plus the
+# sentinel get_nginx_proxies() puts in front of each file's content. Comments
+# are matched (and skipped) too, so a commented-out directive missing its ';'
+# can't swallow the directives after it. Values may span lines but can't
+# contain NUL, so a directive never runs into the next file.
+_NGINX_DIRECTIVE_RE = re.compile(
+    r"\x00FILE:(?P<file>[^\x00]*)\x00"
+    r"|#[^\n\x00]*"
+    r"|server_name\s+(?P<server_name>[^;\x00]+);"
+    r"|proxy_pass\s+(?P<proxy_pass>[^;\x00]+);"
+    r"|ssl_certificate\s+(?P<ssl_certificate>[^;\x00]+);"
+)
+
+# A container name starting with a known solution followed by '_' or '-'.
+_SOLUTION_PREFIX_RE = re.compile(
+    "(" + "|".join(re.escape(s) for s in KNOWN_SOLUTIONS) + ")[_-]"
+)
+
+# The line ending a PEM encoded certificate.
+_PEM_CERT_END = b"-----END CERTIFICATE-----"
+
+# Prefix of the comment UFW writes before every rule in its rules files.
+_UFW_TUPLE_MARKER = '### tuple ###'
+
 # --- Flask App Initialization ---
 app = Flask(__name__)
 # Enable Cross-Origin Resource Sharing (CORS) to allow the frontend
@@ -36,6 +97,39 @@ app = Flask(__name__)
 # Add 'X-Auth-Token' to the list of allowed headers for CORS
 CORS(app, expose_headers=['X-Auth-Token'])
 
+# Shared Docker Engine API client, see get_docker_client().
+_DOCKER = None
+
+# Containers by ID as formatted for the frontend, kept up to date by the
+# background thread running _watch_docker_events(). _CONTAINERS_READY is set
+# while the snapshot is in sync with the daemon.
+_CONTAINERS = {}
+_CONTAINERS_LOCK = threading.Lock()
+_CONTAINERS_READY = threading.Event()
+_DOCKER_WATCHER = None
+
+# Container events that can change what the dashboard shows.
+_DOCKER_CONTAINER_EVENTS = frozenset({
+    "create", "start", "restart", "stop", "die", "kill",
+    "pause", "unpause", "rename", "update", "destroy",
+})
+
+# Last collected stats and the monotonic time they were collected at,
+# see get_cached_stats(). _STATS_LOCK is held for as long as a refresh runs.
+_STATS_CACHE = {"data": None, "timestamp": float("-inf")}
+_STATS_LOCK = threading.Lock()
+
+# Parsed SSL certificates keyed by path, as (st_mtime_ns, parsed), see _parse_cert().
+_SSL_CERT_CACHE = {}
+
+# The most recently submitted future of each collector, see collect_stats().
+_COLLECTOR_FUTURES = {}
+
+# Worker threads used to run the data collectors concurrently.
+_POOL = ThreadPoolExecutor(max_workers=4)
+# Separate worker threads for loading the SSL certificates of Nginx proxies.
+_NGINX_POOL = ThreadPoolExecutor(max_workers=8)
+
 
 # --- Security Decorator ---
 def require_auth(f):
@@ -53,150 +147,330 @@ def require_auth(f):
 
 # --- Data Collection Functions ---
 
-def get_docker_containers():
+def get_docker_client():
+    """
+    Returns the shared Docker Engine API client, creating it on first use.
+
+    The client is kept for the lifetime of the process so its HTTP connection
+    pool to the Docker socket is reused between requests. It is created lazily
+    so the agent still starts (and keeps retrying) when the daemon is down.
     """
-    Fetches details for all Docker containers using 'docker inspect'.
+    global _DOCKER
+    if _DOCKER is None:
+        _DOCKER = docker.from_env()
+    return _DOCKER
+
+
+def _get_configured_image(container_id, default):
+    """
+    Returns the image reference a container was created with ('Config.Image'
+    in 'docker inspect'), e.g. 'redis:7'.
     
-    This method is more robust as 'docker inspect' provides full details,
-    including labels and the full image ID, in a proper JSON array format.
+    Args:
+        container_id (str): The ID of the container to inspect.
+        default (str): Returned if the container can't be inspected (e.g.
+            it was removed in the meantime).
+    """
+    try:
+        return get_docker_client().api.inspect_container(container_id)["Config"]["Image"]
+    except (DockerException, OSError, KeyError, TypeError):
+        return default
+
+
+def _format_container(data):
+    """
+    Formats a container from the Docker list view into the object the
+    frontend expects.
     
-    It also determines a 'solution' for each container (e.g., 'appwrite', 'mailcow')
+    It also determines a 'solution' for the container (e.g., 'appwrite', 'mailcow')
     based on Docker labels or container names, which the frontend uses for grouping.
+    
+    Args:
+        data (dict): One entry of the '/containers/json' response.
     """
-    try:
-        # 1. Get all container IDs (quiet mode, all containers)
-        id_command = ["docker", "ps", "-aq"]
-        id_result = subprocess.run(id_command, capture_output=True, text=True, check=True)
-        
-        # Exit early if there are no containers
-        container_ids_str = id_result.stdout.strip()
-        if not container_ids_str:
-            return []
-        container_ids = container_ids_str.split('\n')
-
-        # 2. Inspect all containers at once to get full details in a single JSON array
-        inspect_command = ["docker", "inspect"] + container_ids
-        inspect_result = subprocess.run(inspect_command, capture_output=True, text=True, check=True)
-        
-        inspected_data = json.loads(inspect_result.stdout)
-        
-        containers = []
-        for data in inspected_data:
-            # --- Format Port Bindings into a simple list of strings ---
-            port_bindings = data.get("HostConfig", {}).get("PortBindings", {})
-            ports = []
-            if port_bindings:
-                for container_port, host_bindings in port_bindings.items():
-                    if host_bindings:
-                        for binding in host_bindings:
-                            host_port = binding.get("HostPort", "")
-                            # Format as "HostPort:ContainerPort"
-                            ports.append(f"{host_port}:{container_port.split('/')[0]}")
-
-            # --- Determine the solution/group for the container ---
-            solution = "standalone"
-            labels = data.get("Config", {}).get("Labels", {})
-            compose_project = labels.get("com.docker.compose.project")
-            
-            if compose_project:
-                solution = compose_project
-            else:
-                # Fallback to checking the container name for known prefixes
-                container_name = data.get("Name", "").lstrip('/')
-                known_solutions = ["mailcow", "appwrite"] # This list can be expanded
-                for s in known_solutions:
-                    if container_name.startswith(s + '_') or container_name.startswith(s + '-'):
-                        solution = s
-                        break
-            
-            # --- Format the final container object for the frontend ---
-            containers.append({
-                "id": data.get("Id", ""),
-                "name": data.get("Name", "").lstrip('/'),
-                "status": data.get("State", {}).get("Status", "unknown"),
-                "image": data.get("Config", {}).get("Image", "unknown"),
-                "ports": sorted(ports), # Sort ports for consistent ordering
-                "created": data.get("Created", ""),
-                "command": ' '.join(data.get("Config", {}).get("Cmd", []) or []),
-                "imageId": data.get("Image", ""), # This is the full Image SHA from inspect
-                "solution": solution # Add the solution key for the frontend
+    # --- Format published ports into a sorted list of "HostPort:ContainerPort" ---
+    # The list view reports one entry per bound host address (e.g. both
+    # 0.0.0.0 and ::), so collect into a set to drop the duplicates. Sorting
+    # the set gives consistent ordering and is the only list built.
+    ports = sorted({
+        f"{binding['PublicPort']}:{binding.get('PrivatePort', '')}"
+        for binding in data.get("Ports") or []
+        if binding.get("PublicPort")
+    })
+
+    # The list view reports names with a leading '/', e.g. '/mailcow_redis'.
+    container_name = (data.get("Names") or [""])[0].lstrip('/')
+
+    # --- Determine the solution/group for the container ---
+    solution = (data.get("Labels") or {}).get("com.docker.compose.project")
+    if not solution:
+        # Fallback to checking the container name for known prefixes
+        solution_match = _SOLUTION_PREFIX_RE.match(container_name)
+        solution = solution_match.group(1) if solution_match else "standalone"
+    
+    # The list view reports the bare image ID instead of the image the
+    # container was created with once that tag points at another image (e.g.
+    # after a 'docker pull' without recreating the container). Only then is
+    # an inspect call needed to get the name back.
+    image = data.get("Image", "unknown")
+    if image.startswith("sha256:"):
+        image = _get_configured_image(data.get("Id", ""), image)
+    
+    # --- Format the final container object for the frontend ---
+    return {
+        "id": data.get("Id", ""),
+        "name": container_name,
+        "status": data.get("State", "unknown"),
+        "image": image,
+        "ports": ports,
+        # The list view reports a Unix timestamp; the frontend expects a date string.
+        "created": datetime.fromtimestamp(data.get("Created", 0), timezone.utc).isoformat(),
+        # Entrypoint and command joined, as 'docker ps --no-trunc' shows it.
+        "command": data.get("Command", ""),
+        "imageId": data.get("ImageID", ""), # This is the full Image SHA
+        "solution": solution # Add the solution key for the frontend
+    }
+
+
+def _watch_docker_events():
+    """
+    Keeps _CONTAINERS in sync with the Docker daemon. Runs forever in the
+    background thread started by get_docker_containers().
+    
+    The events stream is opened before the snapshot is seeded with a full
+    listing, so no change in between is missed. After that only containers
+    named in an event are re-fetched. If the daemon goes away the snapshot
+    is marked stale and the watcher reconnects and re-seeds.
+    """
+    while True:
+        try:
+            api = get_docker_client().api
+            # Let the daemon drop events we don't act on (notably the exec_* and
+            # health_status events every healthcheck emits) rather than
+            # streaming and decoding them only to discard them here.
+            events = api.events(decode=True, filters={
+                "type": "container",
+                "event": sorted(_DOCKER_CONTAINER_EVENTS),
             })
-            
-        return containers
-    except (subprocess.CalledProcessError, FileNotFoundError, json.JSONDecodeError) as e:
-        print(f"Error getting Docker containers: {e}")
+            try:
+                listed_data = api.containers(all=True)
+                with _CONTAINERS_LOCK:
+                    _CONTAINERS.clear()
+                    _CONTAINERS.update((data["Id"], _format_container(data)) for data in listed_data)
+                _CONTAINERS_READY.set()
+
+                for event in events:
+                    container_id = event.get("Actor", {}).get("ID") or event.get("id")
+                    if event["Action"] == "destroy":
+                        listed_data = []
+                    else:
+                        listed_data = api.containers(all=True, filters={"id": container_id})
+                    with _CONTAINERS_LOCK:
+                        if listed_data:
+                            _CONTAINERS[container_id] = _format_container(listed_data[0])
+                        else:
+                            _CONTAINERS.pop(container_id, None)
+            finally:
+                events.close()
+        except (DockerException, OSError) as e:
+            app.logger.error("Error watching Docker events: %s", e)
+        except Exception:
+            # Keep the watcher alive; a dead thread would serve a stale snapshot.
+            app.logger.exception("Unexpected error watching Docker events")
+        _CONTAINERS_READY.clear()
+        time.sleep(DOCKER_EVENTS_RETRY_DELAY)
+
+
+def _start_docker_watcher():
+    """Starts the background thread running _watch_docker_events(), once."""
+    global _DOCKER_WATCHER
+    with _CONTAINERS_LOCK:
+        if _DOCKER_WATCHER is None:
+            _DOCKER_WATCHER = threading.Thread(target=_watch_docker_events, name="docker-events", daemon=True)
+            _DOCKER_WATCHER.start()
+
+
+def get_docker_containers():
+    """
+    Fetches details for all Docker containers.
+    
+    Containers are served from an in-memory snapshot that a background thread
+    keeps up to date from the Docker events stream, so a request normally
+    costs no call to the daemon at all. Until the snapshot is ready (or while
+    the daemon is unreachable) this falls back to a single
+    '/containers/json?all=1' call.
+    """
+    if _DOCKER_WATCHER is None:
+        _start_docker_watcher()
+
+    if _CONTAINERS_READY.is_set():
+        with _CONTAINERS_LOCK:
+            return list(_CONTAINERS.values())
+
+    try:
+        listed_data = get_docker_client().api.containers(all=True)
+        return [_format_container(data) for data in listed_data]
+    except (DockerException, OSError) as e:
+        app.logger.error("Error getting Docker containers: %s", e)
         return []
 
 
+def _format_ufw_rule(fields, ipv6):
+    """
+    Formats the fields of a '### tuple ###' rule marker the way 'ufw status'
+    prints them in its 'To' column (e.g. '22/tcp', '80 (v6)', 'Nginx Full',
+    'Anywhere/tcp', '22/tcp on eth0').
+    
+    Args:
+        fields (list): The marker fields after the action, i.e. protocol,
+            destination port, destination address, source port, source
+            address, for application rules the application names, and
+            finally the direction ('in', 'out', or e.g. 'in_eth0' for rules
+            bound to an interface).
+        ipv6 (bool): Whether the rule came from the IPv6 rules file.
+    """
+    protocol, dport, dst = fields[0], fields[1], fields[2]
+    if len(fields) >= 8 and fields[5] != '-':
+        # Application profile rules store the profile name URL-quoted.
+        port = unquote(fields[5])
+    elif dport == 'any':
+        port = ''
+    elif protocol == 'any':
+        port = dport
+    else:
+        port = f"{dport}/{protocol}"
+    if dst not in ('0.0.0.0/0', '::/0'):
+        port = f"{dst} {port}".rstrip()
+    if not port:
+        port = 'Anywhere' if protocol == 'any' else f"Anywhere/{protocol}"
+    if ipv6:
+        port += ' (v6)'
+    interface = fields[-1].partition('_')[2]
+    if interface:
+        port += f" on {interface}"
+    return port
+
+
 def get_firewall_rules():
     """
     Fetches the current UFW (Uncomplicated Firewall) status and rules.
     
-    Parses the output of 'sudo ufw status' to get allowed and blocked ports.
-    This function has been updated to handle various UFW output formats,
-    including rules with 'LIMIT' and IPv6 notations.
+    Reads the rules UFW persists in its 'user.rules' and 'user6.rules' files
+    instead of running 'ufw status', which has to dump iptables on every call.
+    Each rule in those files is preceded by a comment of the form
+    '### tuple ### <action> <proto> <dport> <dst> <sport> <src> [<dapp> <sapp>] <direction>'
+    which holds everything the dashboard needs. 'LIMIT' rules and IPv6 rules
+    are reported the same way 'ufw status' shows them.
     """
-    rules = {"allowed": [], "blocked": []}
+    # Insertion-ordered dicts act as sets, dropping duplicates while keeping
+    # the order in which UFW lists the rules.
+    allowed = {}
+    blocked = {}
     try:
-        # Command to get the UFW status.
-        command = ["ufw", "status"]
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        print(result)
-        print("hi")
-        # This improved regex captures the full port/protocol description and the action.
-        # It handles 'ALLOW', 'DENY', and 'LIMIT', as well as complex port names like '22/tcp' or '80 (v6)'.
-        rule_pattern = re.compile(r"^(.+?)\s+(ALLOW|DENY|LIMIT)\s+")
-        
-        for line in result.stdout.split('\n'):
-            match = rule_pattern.search(line.strip())
-            if match:
+        # 'ufw status' lists no rules while the firewall is disabled.
+        with open(UFW_CONF_PATH, 'r') as f:
+            if 'ENABLED=yes' not in f.read().split():
+                return {"allowed": [], "blocked": []}
+
+        for rules_path, ipv6 in UFW_RULES_PATHS:
+            with open(rules_path, 'r') as f:
+                content = f.read()
+
+            for line in content.split('\n'):
+                if not line.startswith(_UFW_TUPLE_MARKER):
+                    continue
+                fields = line[len(_UFW_TUPLE_MARKER):].split()
+                # Drop a trailing 'comment=...' field added by newer UFW versions.
+                if fields and fields[-1].startswith('comment='):
+                    fields.pop()
+                if len(fields) < 7:
+                    continue
+                # The action, e.g. 'allow', 'limit_log' or 'route:deny'
+                action = fields[0].rpartition(':')[2].split('_')[0]
                 # The full port description (e.g., '22/tcp', '80 (v6)')
-                port = match.group(1).strip() 
-                # The action (e.g., 'ALLOW', 'DENY', 'LIMIT')
-                action = match.group(2)
+                port = _format_ufw_rule(fields[1:], ipv6)
                 
-                if action == "ALLOW" or action == "LIMIT":
+                if action == "allow" or action == "limit":
                     # Treat 'LIMIT' as a type of 'ALLOW' for the dashboard
-                    if port not in rules["allowed"]:
-                        rules["allowed"].append(port)
-                elif action == "DENY":
-                    if port not in rules["blocked"]:
-                        rules["blocked"].append(port)
-        return rules
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        print(f"Error getting firewall rules: {e}")
+                    allowed[port] = None
+                elif action == "deny":
+                    blocked[port] = None
+        return {"allowed": list(allowed), "blocked": list(blocked)}
+    except OSError as e:
+        app.logger.error("Error getting firewall rules: %s", e)
         # Return empty lists if UFW is not installed or an error occurs.
         return {"allowed": [], "blocked": []}
 
-def get_ssl_details(cert_path):
+def _parse_cert(cert_path):
     """
     Reads an SSL certificate file and extracts its issuer and expiry date.
     
+    Parsed certificates are memoized per path together with the file's
+    modification time, so a certificate is only decoded again after it has
+    been renewed.
+    
     Args:
         cert_path (str): The absolute path to the SSL certificate file.
     
     Returns:
-        A dictionary with SSL details or None if the cert can't be read.
+        A dictionary with the 'issuer' and 'expiry_date' (an aware UTC datetime).
+    """
+    mtime = os.stat(cert_path).st_mtime_ns
+    cached = _SSL_CERT_CACHE.get(cert_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(cert_path, "rb") as cert_file:
+        cert_data = cert_file.read()
+    
+    # Only the first (leaf) certificate is used, so don't make the parser
+    # decode the rest of a fullchain file.
+    end = cert_data.find(_PEM_CERT_END)
+    if end != -1:
+        cert_data = cert_data[:end + len(_PEM_CERT_END)]
+    
+    cert = x509.load_pem_x509_certificate(cert_data, default_backend())
+    
+    # Extract issuer and expiry date. Fall back to the full issuer name for
+    # CAs that don't set a common name.
+    common_names = cert.issuer.get_attributes_for_oid(x509.NameOID.COMMON_NAME)
+    parsed = {
+        "issuer": common_names[0].value if common_names else cert.issuer.rfc4514_string(),
+        "expiry_date": cert.not_valid_after_utc
+    }
+    _SSL_CERT_CACHE[cert_path] = (mtime, parsed)
+    return parsed
+
+
+def get_ssl_details(cert_path, now):
+    """
+    Returns the SSL details of a certificate file for the frontend.
+    
+    Only 'daysLeft' depends on the current time, so it is computed here from
+    the memoized result of _parse_cert().
+    
+    Args:
+        cert_path (str): The absolute path to the SSL certificate file.
+        now (datetime): The current time as an aware UTC datetime, taken once
+            per collection by the caller.
+    
+    Returns:
+        A dictionary with SSL details, with placeholder values if the cert
+        can't be read.
     """
     try:
-        with open(cert_path, "rb") as cert_file:
-            cert_data = cert_file.read()
-        
-        cert = x509.load_pem_x509_certificate(cert_data, default_backend())
-        
-        # Extract issuer and expiry date.
-        issuer = cert.issuer.get_attributes_for_oid(x509.NameOID.COMMON_NAME)[0].value
-        expiry_date = cert.not_valid_after
-        days_left = (expiry_date - datetime.now()).days
+        cert = _parse_cert(cert_path)
+        issuer = cert["issuer"]
+        days_left = (cert["expiry_date"] - now).days
         
         return {
             "issuer": issuer,
-            "expiry": expiry_date.strftime("%Y-%m-%d"),
+            "expiry": cert["expiry_date"].strftime("%Y-%m-%d"),
             "daysLeft": days_left,
             "valid": "Let's Encrypt" in issuer or "R3" in issuer # Simple check for valid CA
         }
-    except Exception as e:
-        print(f"Could not read SSL cert at {cert_path}: {e}")
+    except Exception:
+        app.logger.exception("Could not read SSL cert at %s", cert_path)
         return {
             "issuer": "Unknown/Error",
             "expiry": "N/A",
@@ -204,53 +478,214 @@ def get_ssl_details(cert_path):
             "valid": False
         }
 
+def _read_config(config_path):
+    """
+    Reads a single Nginx configuration file.
+    
+    Returns:
+        The file's content, or None if it can't be read.
+    """
+    try:
+        with open(config_path, 'r') as f:
+            return f.read()
+    except Exception:
+        app.logger.exception("Error reading Nginx config %s", os.path.basename(config_path))
+        return None
+
+
+def _build_proxy(directives, now):
+    """
+    Builds the proxy object for the frontend from the directives found in
+    one Nginx configuration file, including the details of its SSL
+    certificate.
+    
+    Args:
+        directives (dict): The first 'server_name', 'proxy_pass' and (if
+            present) 'ssl_certificate' value found in the file.
+        now (datetime): The current time, passed on to get_ssl_details().
+    """
+    if "ssl_certificate" in directives:
+        cert_path = directives["ssl_certificate"]
+        # Ensure the path is absolute.
+        if not os.path.isabs(cert_path):
+            cert_path = os.path.join('/etc/nginx', cert_path)
+        ssl_details = get_ssl_details(cert_path, now)
+    else:
+        ssl_details = { "issuer": "None", "expiry": "N/A", "daysLeft": 0, "valid": False }
+
+    return {
+        "domain": directives["server_name"],
+        "target": directives["proxy_pass"],
+        "ssl": ssl_details,
+        "status": "active" # Assuming active if configured
+    }
+
+
 def get_nginx_proxies():
     """
     Parses Nginx configuration files to find reverse proxy settings.
     
     Scans files in the NGINX_SITES_ENABLED_PATH for 'server_name', 'proxy_pass',
-    and 'ssl_certificate' directives.
+    and 'ssl_certificate' directives. All files are joined, each preceded by
+    a sentinel, and scanned with a single regex pass; matches are attributed
+    to the file of the last sentinel seen. SSL certificates are then loaded in
+    parallel on a dedicated pool, since this collector itself runs on _POOL
+    and waiting on that pool from inside it could deadlock.
     """
-    proxies = []
     if not os.path.isdir(NGINX_SITES_ENABLED_PATH):
-        print(f"Nginx config directory not found at {NGINX_SITES_ENABLED_PATH}")
+        app.logger.warning("Nginx config directory not found at %s", NGINX_SITES_ENABLED_PATH)
         return []
 
-    for config_file in os.listdir(NGINX_SITES_ENABLED_PATH):
-        config_path = os.path.join(NGINX_SITES_ENABLED_PATH, config_file)
+    # DirEntry caches its stat result, so each entry (typically a symlink into
+    # sites-available) is resolved once, and directories are skipped up front.
+    with os.scandir(NGINX_SITES_ENABLED_PATH) as entries:
+        config_paths = [entry.path for entry in entries if entry.is_file()]
+    chunks = []
+    for config_path in config_paths:
+        content = _read_config(config_path)
+        if content is not None:
+            chunks.append(f"\x00FILE:{config_path}\x00")
+            chunks.append(content)
+
+    # Keep the first value of each directive per file.
+    configs = []
+    for match in _NGINX_DIRECTIVE_RE.finditer("".join(chunks)):
+        if match.lastgroup is None:
+            # A comment.
+            continue
+        if match.lastgroup == "file":
+            directives = {}
+            configs.append(directives)
+        else:
+            # Collapse values spread over several lines, e.g. a server_name
+            # listing one domain per line, into single-spaced text.
+            value = " ".join(match.group(match.lastgroup).split())
+            directives.setdefault(match.lastgroup, value)
+
+    configs = [
+        directives for directives in configs
+        if "server_name" in directives and "proxy_pass" in directives
+    ]
+    now = datetime.now(timezone.utc)
+    return list(_NGINX_POOL.map(_build_proxy, configs, repeat(now)))
+
+
+# --- Stats Cache ---
+
+def collect_stats():
+    """
+    Runs all the data collectors and assembles the response in the format
+    expected by the frontend.
+    
+    The collectors are independent and mostly wait on I/O, so they run
+    concurrently on the shared pool and the total time is that of the
+    slowest one rather than the sum of all three. The request thread waits
+    at most COLLECTOR_TIMEOUT seconds for all of them together; a collector
+    that is still running by then (e.g. a hung Docker daemon) is reported
+    as empty instead of holding the request open.
+    
+    A collector that is still queued when the wait times out is cancelled,
+    and one that is still running is not submitted again: later collections
+    wait on the same future until it finishes. That way a hung collector
+    holds at most one worker and can't starve the others. Must be called
+    with _STATS_LOCK held, which also guards _COLLECTOR_FUTURES.
+    """
+    collectors = {
+        "docker_containers": get_docker_containers,
+        "firewall_rules": get_firewall_rules,
+        "nginx_proxies": get_nginx_proxies
+    }
+    futures = {}
+    for key, collector in collectors.items():
+        future = _COLLECTOR_FUTURES.get(key)
+        if future is None or future.done():
+            future = _POOL.submit(collector)
+            _COLLECTOR_FUTURES[key] = future
+        futures[key] = future
+    # The same empty values the collectors themselves return on error.
+    defaults = {
+        "docker_containers": [],
+        "firewall_rules": {"allowed": [], "blocked": []},
+        "nginx_proxies": []
+    }
+    
+    done, not_done = wait(futures.values(), timeout=COLLECTOR_TIMEOUT)
+    for future in not_done:
+        # Only takes effect if the collector hasn't started running yet.
+        future.cancel()
+    
+    response_data = {}
+    for key, future in futures.items():
+        if future in done:
+            response_data[key] = future.result()
+        else:
+            app.logger.warning("Timed out collecting %s after %ss", key, COLLECTOR_TIMEOUT)
+            response_data[key] = defaults[key]
+    return response_data
+
+
+def _refresh_stats():
+    """
+    Runs the collectors and stores the serialized result in the cache.
+    
+    The stats are serialized with orjson once per collection rather than on
+    every request, so cache hits only have to send the cached bytes. Must be
+    called with _STATS_LOCK held.
+    """
+    _STATS_CACHE["data"] = orjson.dumps(collect_stats())
+    _STATS_CACHE["timestamp"] = time.monotonic()
+    return _STATS_CACHE["data"]
+
+
+def _refresh_stats_in_background():
+    """
+    Refreshes the cache on a background thread, unless a refresh is already
+    running, in which case its result will do.
+    
+    The refresh gets its own thread rather than a _POOL worker because it
+    waits on the collectors it submits to _POOL.
+    """
+    if not _STATS_LOCK.acquire(blocking=False):
+        return
+
+    def refresh():
         try:
-            with open(config_path, 'r') as f:
-                content = f.read()
-                
-                # Regex to find server_name, proxy_pass, and ssl_certificate.
-                server_name_match = re.search(r"server_name\s+([^;]+);", content)
-                proxy_pass_match = re.search(r"proxy_pass\s+([^;]+);", content)
-                ssl_cert_match = re.search(r"ssl_certificate\s+([^;]+);", content)
-                
-                if server_name_match and proxy_pass_match:
-                    domain = server_name_match.group(1).strip()
-                    target = proxy_pass_match.group(1).strip()
-                    ssl_details = {}
-
-                    if ssl_cert_match:
-                        cert_path = ssl_cert_match.group(1).strip()
-                        # Ensure the path is absolute.
-                        if not os.path.isabs(cert_path):
-                            cert_path = os.path.join('/etc/nginx', cert_path)
-                        ssl_details = get_ssl_details(cert_path)
-                    else:
-                        ssl_details = { "issuer": "None", "expiry": "N/A", "daysLeft": 0, "valid": False }
+            _refresh_stats()
+        except Exception:
+            app.logger.exception("Error refreshing stats in the background")
+        finally:
+            _STATS_LOCK.release()
 
-                    proxies.append({
-                        "domain": domain,
-                        "target": target,
-                        "ssl": ssl_details,
-                        "status": "active" # Assuming active if configured
-                    })
-        except Exception as e:
-            print(f"Error parsing Nginx config {config_file}: {e}")
-            
-    return proxies
+    threading.Thread(target=refresh, name="stats-refresh", daemon=True).start()
+
+
+def get_cached_stats():
+    """
+    Returns the collected stats serialized as JSON bytes, re-running the
+    collectors at most once per STATS_CACHE_TTL seconds.
+    
+    Stats older than that but younger than STATS_STALE_TTL are still
+    returned immediately while a refresh runs in the background
+    (stale-while-revalidate), so those requests never wait on the
+    collectors. Only when there are no stats yet, or they are older than
+    STATS_STALE_TTL, does the request collect them itself.
+    
+    Concurrent requests that arrive while the cache is stale wait on a lock
+    and then reuse the result of whichever request collected first, so a
+    burst of dashboard polls costs a single collection.
+    """
+    age = time.monotonic() - _STATS_CACHE["timestamp"]
+    if age < STATS_CACHE_TTL:
+        return _STATS_CACHE["data"]
+    if age < STATS_STALE_TTL:
+        _refresh_stats_in_background()
+        return _STATS_CACHE["data"]
+
+    with _STATS_LOCK:
+        # Another request may have refreshed the cache while we were waiting.
+        if time.monotonic() - _STATS_CACHE["timestamp"] < STATS_CACHE_TTL:
+            return _STATS_CACHE["data"]
+        return _refresh_stats()
 
 
 # --- Flask API Endpoint ---
@@ -262,29 +697,21 @@ def get_all_stats():
     The main API endpoint that gathers all data and returns it as a single
     JSON object.
     """
-    print(f"Authenticated Request received for /api/v1/stats at {datetime.now()}")
+    app.logger.debug("Authenticated Request received for /api/v1/stats")
     
-    # Gather all data from the helper functions.
-    docker_data = get_docker_containers()
-    firewall_data = get_firewall_rules()
-    nginx_data = get_nginx_proxies()
-    
-    # Assemble the final JSON response in the format expected by the frontend.
-    response_data = {
-        "docker_containers": docker_data,
-        "firewall_rules": firewall_data,
-        "nginx_proxies": nginx_data
-    }
-    
-    return jsonify(response_data)
+    return Response(get_cached_stats(), mimetype='application/json')
 
 # --- Main Execution ---
 
 if __name__ == '__main__':
     """
-    The entry point of the script. Starts the Flask web server.
+    The entry point of the script. Starts the Flask development server,
+    which is handy for trying the agent out locally. In production, run the
+    agent under gunicorn instead (see the README), e.g.:
+    
+        gunicorn -w 4 -k gthread --threads 8 -b 127.0.0.1:9797 agent:app
     """
     print(f"Starting VPS Monitoring Agent on http://{HOST}:{PORT}")
-    # The 'debug=True' option provides detailed error messages in the browser,
-    # which is helpful during development. You should turn this off for production.
-    app.run(host=HOST, port=PORT, debug=True)
+    # Pass debug=True for detailed error pages and auto-reload while developing.
+    # Never enable it on a public server: the debugger allows running code.
+    app.run(host=HOST, port=PORT)